@@ -3,6 +3,10 @@ Cluster data pre-processing module.
 
 This module contains functions used for pre-processing candidate-match data for k-means cluster analysis.
 
+The individual pre-processing functions add their new columns to the DataFrame they are given, they don't
+copy it first. Pass df.copy() if the original is still needed. cluster_preprocessing makes one copy up front,
+so its input is never changed.
+
 Author: Tom Murray, Candid Hospitality
 Date: 16/10/2025
 Version:
@@ -25,10 +29,9 @@ def normalise_culture_code_component(df, attribute_col):
         attribute_col (str): Name of column containing attribute to be scaled
         
     Returns: 
-        Copy of DataFrame with added column containing normalised attributes
+        DataFrame with added column containing normalised attributes (added to df in place)
     
     """
-    df = df.copy()
     df[f'normalised_{attribute_col}'] = df[attribute_col] / 9
     return df
 
@@ -45,23 +48,20 @@ def normalise_salary_departmentwise(df, dept_col, salary_col):
         salary_col (str): Name of column containing salaries to be normalised
         
     Returns: 
-        Copy of DataFrame with added column containing departmentally normalised salaries
+        DataFrame with added column containing departmentally normalised salaries (added to df in place)
     
     """
-    df = df.copy()
-    
     # convert salries into z scores
-    df["z_salary"] = df.groupby(dept_col)[salary_col].transform(
-        lambda x: (x-x.mean())/x.std(ddof=0) if x.notna().any() else x
-        )
+    salaries = df.groupby(dept_col, observed=True)[salary_col]
+    z_salary = (df[salary_col] - salaries.transform("mean")) / salaries.transform("std", ddof=0)
     
-    # normalise scores into [0,1]
-    df["normalised_salary"] = df.groupby(dept_col)["z_salary"].transform(
-        lambda x: ((x-x.min())/(x.max()-x.min())) if x.max() != x.min() else 0.5
-        )
+    # normalise scores into [0,1], 0.5 if all scores in department are the same
+    z_scores = z_salary.groupby(df[dept_col], observed=True)
+    z_min = z_scores.transform("min")
+    z_max = z_scores.transform("max")
+    df["normalised_salary"] = np.where(z_max != z_min, (z_salary - z_min) / (z_max - z_min), 0.5)
     
-    # remove intermediate z score column
-    return df.drop(columns = "z_salary")
+    return df
 
 #------NORMALISE-AGES-----------------------------------------------------------------------------------------------------------
 
@@ -74,10 +74,9 @@ def normalise_ages(df, age_col):
         age_col (str): Name of column containing ages to be normalised
         
     Returns: 
-        Copy of Dataframe with added column containing normalised ages
+        Dataframe with added column containing normalised ages (added to df in place)
     
     """
-    df = df.copy()
     ages = df[age_col]
     
     min_age = ages.min()
@@ -91,6 +90,30 @@ def normalise_ages(df, age_col):
     
     return df
 
+#-----HAVERSINE-RANK-SCORE------------------------------------------------------------------------------------------------------
+
+def haversine_rank_score(lat1, lng1, lat2, lng2):
+    """ 
+    Compute the "harvesine" term a for two coordinates (lat1,lng1), (lat2,lng2) on a sphere.
+    Distance is 2*R*arcsin(sqrt(a)), which increases with a, so a ranks points in the same order
+    as the distance does. Use this when only the nearest point is needed, not the distance in km.
+    
+    Arguments: 
+        lat1 (float): Latitude coordinate of first point
+        lng1 (float): Longitude coordinate of first point
+        lat2 (float): Latitude coordinate of second point
+        lng2 (float): Longitude coordinate of second point
+        
+    Returns: Harvesine rank score of the two points, in range [0,1].
+    """
+    lat1, lng1, lat2, lng2 = map(np.radians, [lat1, lng1, lat2, lng2])
+    
+    dlat = lat2 - lat1
+    dlng = lng2 - lng1
+    
+    # harvesine formula, without the arcsin and sqrt
+    return np.sin(dlat / 2.0)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlng / 2.0)**2
+
 #-----HAVERSINE-DISTANCE--------------------------------------------------------------------------------------------------------
 
 def haversine_distance(lat1, lng1, lat2, lng2):
@@ -107,17 +130,54 @@ def haversine_distance(lat1, lng1, lat2, lng2):
     """
     R = 6371 # Radius of earth
     
-    lat1, lng1, lat2, lng2 = map(np.radians, [lat1, lng1, lat2, lng2])
-    
-    dlat = lat2 - lat1
-    dlng = lng2 - lng1
-    
     # harvesine formula
-    a = np.sin(dlat / 2.0)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlng / 2.0)**2
+    a = haversine_rank_score(lat1, lng1, lat2, lng2)
     c = 2 * np.arcsin(np.sqrt(a))
     
     return R*c
     
+#-----NEAREST-POINT-INDEX-------------------------------------------------------------------------------------------------------
+
+def nearest_point_index(lat1, lng1, lat2, lng2, chunk_size=65536):
+    """ 
+    For each point (lat1,lng1), find the index of the nearest point (lat2,lng2) by harvesine distance.
+    Loops over the (few) second points keeping a running minimum, so memory use is one array per
+    first point rather than a full distance matrix. First points are worked through in chunks so
+    these arrays stay small enough to be kept in cache.
+    
+    Arguments: 
+        lat1 (array): Latitude coordinates of first points, e.g. users
+        lng1 (array): Longitude coordinates of first points
+        lat2 (array): Latitude coordinates of second points, e.g. cluster cities
+        lng2 (array): Longitude coordinates of second points
+        chunk_size (int): Number of first points handled at a time
+        
+    Returns: Array of indices into lat2/lng2, first index if tied (0 if first point is NaN).
+    """
+    lat1, lng1, lat2, lng2 = map(np.radians, [lat1, lng1, lat2, lng2])
+    cos_lat1 = np.cos(lat1)
+    cos_lat2 = np.cos(lat2)
+    
+    best_idx = np.zeros(len(lat1), dtype=np.intp)
+    
+    for start in range(0, len(lat1), chunk_size):
+        chunk = slice(start, start + chunk_size)
+        chunk_lat, chunk_lng, chunk_cos = lat1[chunk], lng1[chunk], cos_lat1[chunk]
+        chunk_idx = best_idx[chunk] # view, so updates are written to best_idx
+        best_score = np.full(len(chunk_lat), np.inf, dtype=lat1.dtype)
+        
+        for k in range(len(lat2)):
+            # harvesine rank score (see haversine_rank_score) between every first point and point k
+            score = (np.sin((lat2[k] - chunk_lat) / 2.0)**2
+                     + chunk_cos * cos_lat2[k] * np.sin((lng2[k] - chunk_lng) / 2.0)**2)
+            
+            # keep point k where it is strictly closer than the best so far
+            closer = score < best_score
+            best_score[closer] = score[closer]
+            chunk_idx[closer] = k
+    
+    return best_idx
+
 #-----NEAREST-CITY-------------------------------------------------------------------------------------------------------------
 
 def nearest_city(df, city_col, lat_col, lng_col, cluster_cities):
@@ -138,32 +198,29 @@ def nearest_city(df, city_col, lat_col, lng_col, cluster_cities):
                                    - Must contain columns ["city", "lat", "lng"]
         
     Returns: 
-        Copy of DataFrame with added column nearest city
+        DataFrame with added column nearest city (added to df in place)
         
     """
-    df = df.copy()
-    cluster_names = set(cluster_cities['city'].str.lower().str.strip())
-    
-    def find_nearest(row):
-        
-        # if latitude and longitude unkown, return na
-        if pd.isna(row[lat_col]) or pd.isna(row[lng_col]):
-            return np.nan
-        
-        # if city_name already matches one in cluster_cities, return city_name
-        city_name = str(row[city_col]).strip().lower()
-        if city_name in cluster_names:
-            return row[city_col]
-        
-        # if else: calculate harvesine distance, return nearest city
-        distances = haversine_distance(
-            row[lat_col], row[lng_col],
-            cluster_cities['lat'].values, cluster_cities['lng'].values
-        )
-        idx_min = np.argmin(distances)
-        return cluster_cities.iloc[idx_min]['city']
-    
-    df['nearest_city'] = df.apply(find_nearest, axis=1)
+    # cluster city lookups, built once (float32 coordinates are plenty for snapping to a city)
+    cluster_names = frozenset(cluster_cities['city'].str.lower().str.strip())
+    cluster_city = cluster_cities['city'].to_numpy()
+    cluster_lat = cluster_cities['lat'].to_numpy(dtype=np.float32)
+    cluster_lng = cluster_cities['lng'].to_numpy(dtype=np.float32)
+    
+    # find index of the cluster city with the smallest harvesine distance to each user
+    idx_min = nearest_point_index(
+        df[lat_col].to_numpy(dtype=np.float32), df[lng_col].to_numpy(dtype=np.float32),
+        cluster_lat, cluster_lng
+    )
+    nearest = cluster_city[idx_min]
+    
+    # if city_name already matches one in cluster_cities, keep city_name, if else use nearest city
+    city_names = df[city_col].astype(str).str.strip().str.lower()
+    nearest = np.where(city_names.isin(cluster_names), df[city_col], nearest)
+    
+    # if latitude and longitude unkown, return na
+    unknown = df[lat_col].isna() | df[lng_col].isna()
+    df['nearest_city'] = pd.Series(nearest, index=df.index).where(~unknown).astype("category")
     return df
 
 #------CONCAT-USERS-------------------------------------------------------------------------------------------------------------
@@ -191,20 +248,44 @@ def concat_users(df, id_col, progressed_col, rejected_col):
     Returns:
         Reduced copy of DataFrame containing 1 row per user with most important match info
     """
-    df = df.copy()
-    
     # assign "priorities"
-    df["priority"] = np.where(df[progressed_col] == 1, 2,
-                     np.where(df[rejected_col] == 1, 1,
-                     0))
+    priority = np.where(df[progressed_col] == 1, 2,
+               np.where(df[rejected_col] == 1, 1,
+               0))
     
-    # rank by priority
-    df = df.sort_values(by=[id_col, 'priority'], ascending=[True, False])
-    # keep most important row
-    df = df.drop_duplicates(subset=id_col, keep='first')
+    # keep most important row per user, first row if priorities are tied
+    best_rows = pd.Series(priority).groupby(df[id_col].to_numpy(), dropna=False).idxmax()
     
-    # remove intermediate priority column 
-    return df.drop(columns='priority')
+    return df.iloc[best_rows.to_numpy()]
+
+#----WEIGHTED-ONE-HOT----------------------------------------------------------------------------------------------------------
+
+def weighted_one_hot(df, col, prefix, weight):
+    """
+    One-hot encode a column, with "weight" in place of 1.
+    
+    Arguments: 
+        df (DataFrame): Input DataFrame
+        col (str): Name of column to be encoded
+        prefix (str): Prefix for the names of the encoded columns, e.g. "city" -> "city_London"
+        weight (float): Desired "weight" of binary columns
+                            
+    Returns:
+        DataFrame with added binary column for each value in col, NaN rows are all 0 (added to df in place)
+
+    """
+    # integer code for each row, -1 if NaN
+    codes, uniques = pd.factorize(df[col], sort=True)
+    
+    # build encoded columns as a single block, put weight where each row's code is
+    encoded = np.zeros((len(df), len(uniques)), dtype=np.float32)
+    rows = np.flatnonzero(codes >= 0)
+    encoded[rows, codes[rows]] = weight
+    
+    # join
+    df[[f"{prefix}_{value}" for value in uniques]] = encoded
+    
+    return df
 
 #----ONE-HOT-CITIES------------------------------------------------------------------------------------------------------------
 
@@ -222,16 +303,11 @@ def encode_cities(df, city_col_clean, weight):
         DataFrame with added binary column for each city in cluster_cities
 
     """
-    if len(df[city_col_clean].unique()) > 20:
+    if df[city_col_clean].nunique(dropna=False) > 20:
         raise ValueError("Too many cities. Please use nearest_city first.")
     
     # one-hot encode the city column
-    encoded = pd.get_dummies(df[city_col_clean], prefix="city")*weight
-    
-    # join 
-    df = pd.concat([df, encoded], axis=1)
-    
-    return df
+    return weighted_one_hot(df, city_col_clean, "city", weight)
 
 #-----ONE-HOT-DEPARTMENTS-------------------------------------------------------------------------------------------------------
 
@@ -248,16 +324,11 @@ def encode_department(df, dept_col, weight):
         DataFrame with added binary column for each city in cluster_cities
 
     """
-    if len(df[dept_col].unique()) > 20:
+    if df[dept_col].nunique(dropna=False) > 20:
         raise ValueError("Too many departments.")
     
     # one-hot encode the department column
-    encoded = pd.get_dummies(df[dept_col], prefix="department")*weight
-    
-    # join 
-    df = pd.concat([df, encoded], axis=1)
-    
-    return df
+    return weighted_one_hot(df, dept_col, "department", weight)
 
 #----MASTER-FUNCTION-----------------------------------------------------------------------------------------------------------
 
@@ -289,7 +360,8 @@ def cluster_preprocessing(df,
         Preprocessed DataFrame ready for clustering
 
     """
-    df = df.copy()
+    # shallow copy once, steps below only add new columns so the input DataFrame is left unchanged
+    df = df.copy(deep=False)
     
     # 1) keep most informative match per user
     df = concat_users(df, id_col, progressed_col, rejected_col)
@@ -5,78 +5,61 @@ from nltk.sentiment import SentimentIntensityAnalyzer
 #------------------------------------------------------------------------------------------------------------------------
 
 # DOB cleaning function
-def clean_dobs(dob):
+def clean_dobs(dob_col):
     """
-    -Fixes incorrectly formatted DOBs, converts YYYYMMDD to YYYY-MM-DD
+    -Fixes incorrectly formatted DOBs, parses both YYYYMMDD and YYYY-MM-DD to datetime
     
     Arguments:
-        dob: raw series of DOBs
+        dob_col: raw series of DOBs
         
     Returns: 
-        dob_str: a corrcetd series of DOBs, NaNs still remain, other errors are fixed
+        dob: a corrected datetime series of DOBs, NaNs and any other errors are returned as NaT
     """
-    # If DOB is nan return without changing
-    if pd.isna(dob):
-        return dob
+    # Convert DOBs to strings so both formats can be parsed
+    dob_str = dob_col.astype("string")
     
-    # Convert DOB to string 
-    dob_str = str(dob)
+    # Parse YYYY-MM-DD (most DOBs), then only parse the DOBs that failed as YYYYMMDD
+    dob = pd.to_datetime(dob_str, format="%Y-%m-%d", errors="coerce")
+    unparsed = dob.isna() & dob_str.notna()
+    dob.loc[unparsed] = pd.to_datetime(dob_str[unparsed], format="%Y%m%d", errors="coerce")
     
-    # If YYYY-MM-DD, return 
-    if "-" in dob_str and len(dob_str) == 10:
-        return dob_str
-    
-    # If YYYYMMDD, split and add '--'
-    if dob_str.isdigit() and len(dob_str) == 8:
-        return f"{dob_str[:4]}-{dob_str[4:6]}-{dob_str[6:]}"
-    
-    # Any other case, return original
-    return dob_str 
+    return dob
 
 #---------------------------------------------------------------------------------------------------------------------
 
 # split culture codes function
-def split_cc(cc):
+def split_cc(cc_col):
     """
     Culture codes should be 4 digits,some are 5 digits or na (error).
     Each digit is a seperate "score".
-    - Checks if a code is na, if so returns na for each component
-    - If not na, convert codes(stored as floats) to integers
-    - Convert integers to strings to allow spliting
-    - Split codes into sepeate components
-    - If a code is 5 digits, rteurn na for each component
+    - Converts codes (stored as floats) to numbers, anything non-numeric becomes na
+    - Marks any code that isn't a 4 digit whole number as invalid (5 digit codes, na)
+    - Split valid codes into sepeate components using integer division, invalid codes return na for each component
     
     Arguments:
-        cc: raw series of culture codes
+        cc_col: raw series of culture codes
         
     Returns:
-        Risk, Extroversion, Patience, Norms
+        DataFrame with columns Risk, Extroversion, Patience, Norms
         If code is ABCD, Risk = A, Extroversion = B, Patience = C, Norms = D
         If code is ABCDE, Risk = nan, Extroversion = nan, Patience = nan, Norms = nan
         If code is nan, Risk = nan, Extroversion = nan, Patience = nan, Norms = nan
     
     """
-    # If code is nan, return 4 length series of nan
-    if pd.isna(cc):
-        return pd.Series([np.nan]*4, index=["risk","extroversion","patience","norms"])
-    
-    # Convert float to integer, then to string
-    if isinstance(cc, float) and cc.is_integer():
-        cc_str = str(int(cc))
-    else:
-        cc_str = str(cc).strip()
+    cc = pd.to_numeric(cc_col, errors="coerce")
     
-    # Split valid code into 4 components
-    if len(cc_str) == 4 and cc_str.isdigit():
-        return pd.Series([int(cc_str[0]), int(cc_str[1]), int(cc_str[2]), int(cc_str[3])],
-                         index=["risk","extroversion","patience","norms"])
+    # Only 4 digit whole numbers are valid codes, 5 digit codes and nan are errors
+    valid = cc.between(1000, 9999) & (cc % 1 == 0)
     
-    # Split 5 digit erroneous code into 4 length series of nan
-    if len(cc_str) == 5 and cc_str.isdigit():
-        return pd.Series([np.nan]*4, index=["risk","extroversion","patience","norms"])
+    # Convert valid codes to integer, invalid codes become na
+    cc_int = cc.where(valid).astype("Int16")
     
-    # Any other case, return 4 length series of nan
-    return pd.Series([np.nan]*4, index=["risk","extroversion","patience","norms"])  
+    # Split codes into 4 components, one column per digit (ABCD // 10**3 % 10 = A, ...)
+    components = ["risk", "extroversion", "patience", "norms"]
+    return pd.DataFrame(
+        {name: (cc_int // 10**(3 - i) % 10).astype("Int8") for i, name in enumerate(components)},
+        index=cc_col.index
+    )
 
 #-----------------------------------------------------------------------------------------------------------------------------
 
@@ -90,21 +73,27 @@ def dob_to_age(dob_col):
         dob_col: CLEANED column of DOBs
         
     Returns:
-        age: column of user ages 
+        age: column of user ages (Int16)
     """
-    dob = pd.to_datetime(dob_col, errors="coerce")
+    # Only parse if the DOBs aren't already stored as datetime (see clean_dobs)
+    if pd.api.types.is_datetime64_any_dtype(dob_col):
+        dob = dob_col
+    else:
+        dob = pd.to_datetime(dob_col, errors="coerce")
     today = pd.to_datetime("today").normalize()
     
-    # Age calculation using years
-    age = today.year - dob.dt.year
+    # Work on the underlying arrays, NaT becomes NaN
+    year = dob.dt.year.to_numpy(dtype=float)
+    month = dob.dt.month.to_numpy(dtype=float)
+    day = dob.dt.day.to_numpy(dtype=float)
     
     # -1 if birthday hasn't occurred yet this year
-    before_birthday = (today.month < dob.dt.month) | (
-        (today.month == dob.dt.month) & (today.day < dob.dt.day)
-    )
-    age -= before_birthday.astype(int)
+    before_birthday = (today.month < month) | ((today.month == month) & (today.day < day))
+    
+    # Age calculation using years
+    age = today.year - year - before_birthday
     
-    return age
+    return pd.Series(pd.array(age, dtype="Int16"), index=dob_col.index)
 
 #------------------------------------------------------------------------------------------------------------------------------
 
@@ -122,74 +111,65 @@ def chat_stats(chat_df, time_unit="s"):
     Returns:
         chat_stats: contains match_id, candidate_messages, company_messages, 
         candidate_response_time, company_response_time, interactivity_metric
+        sorted by match_id
     """
     # Keep only candidate and company messages, remove system messages
-    df = chat_df[chat_df["sender"].isin(["candidate", "company"])].copy()
+    df = chat_df.loc[chat_df["sender"].isin(["candidate", "company"]) & chat_df["match_id"].notna(),
+                     ["match_id", "sender", "timestamp"]]
     # Make sure timestamp is stores as datetime
-    df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
+    df = df.assign(timestamp=pd.to_datetime(df["timestamp"], errors="coerce"))
+    
+    # Sort chats into match id's by timestamp, earliest message first
+    # (single sort, every stat below is worked out from this order)
+    df = df.sort_values(["match_id", "timestamp"], kind="stable")
+    codes, match_ids = pd.factorize(df["match_id"])
+    n_matches = len(match_ids)
+    is_candidate = (df["sender"] == "candidate").to_numpy()
+    timestamps = df["timestamp"].to_numpy(dtype="datetime64[ns]")
     
     # Count messages for both candidate and company per match
-    counts = (
-        df.groupby(["match_id", "sender"])
-        .size()
-        .unstack(fill_value=0)
-        .rename(columns={"candidate": "candidate_msgs", "company": "company_msgs"})
-    )
+    candidate_msgs = np.bincount(codes, weights=is_candidate, minlength=n_matches).astype(np.int64)
+    company_msgs = np.bincount(codes, minlength=n_matches) - candidate_msgs
     
-    # Sort chats into match id's by timestamp, earliest message first
-    df = df.sort_values(["match_id", "timestamp"])
-    df["next_sender"] = df.groupby("match_id")["sender"].shift(-1)
-    df["next_time"] = df.groupby("match_id")["timestamp"].shift(-1)
-    
-    # Only consider when sender changes
-    mask = df["sender"] != df["next_sender"]
-    responses = df.loc[mask, ["match_id", "sender", "timestamp", "next_sender", "next_time"]].copy()
-    
-    # Calculate time difference
-    responses["response_time"] = (responses["next_time"] - responses["timestamp"]).dt.total_seconds()
-    
-    # Attribute response time to the responder (the "next_sender")
-    responses = (
-        responses.groupby(["match_id", "next_sender"])["response_time"]
-        .mean()
-        .unstack()
-        .rename(columns={"candidate": "candidate_response_time",
-                         "company": "company_response_time"})
-    )
+    # Compare each message to the next one, only consider when sender changes within a match
+    response_time = (timestamps[1:] - timestamps[:-1]) / np.timedelta64(1, "s")
+    responses = ((codes[:-1] == codes[1:]) & (is_candidate[:-1] != is_candidate[1:])
+                 & ~np.isnan(response_time))
     
     # Convert units if needed
     if time_unit == "m":  # minutes
-        responses = responses / 60
+        response_time = response_time / 60
     elif time_unit == "h":  # hours
-        responses = responses / 3600
+        response_time = response_time / 3600
     
-    # Merge accounts and reponse times
-    chat_stats = counts.merge(responses, on="match_id", how="left").reset_index()
+    # Attribute response time to the responder (the next sender), average per match
+    def mean_response_time(responder):
+        mask = responses & responder
+        total = np.bincount(codes[1:][mask], weights=response_time[mask], minlength=n_matches)
+        count = np.bincount(codes[1:][mask], minlength=n_matches)
+        return np.divide(total, count, out=np.full(n_matches, np.nan), where=count > 0)
     
     # Calculate "interactivity metric"
     #          -> 1 candidate dominates
     #          -> 0 company dominates
-    chat_stats["interactivity_metric"] = (
-        (chat_stats["candidate_msgs"] - chat_stats["company_msgs"]) /
-        (chat_stats["candidate_msgs"] + chat_stats["company_msgs"])
-    )
+    total_msgs = candidate_msgs + company_msgs
+    interactivity_metric = np.divide(candidate_msgs - company_msgs, total_msgs,
+                                     out=np.zeros(n_matches, dtype=np.float32), where=total_msgs > 0)
+    
+    # Store with smaller types, nullable counts stay integers when merged with unmatched matches
+    chat_stats = pd.DataFrame({
+        "match_id": match_ids,
+        "candidate_msgs": pd.array(candidate_msgs, dtype="Int16"),
+        "company_msgs": pd.array(company_msgs, dtype="Int16"),
+        "candidate_response_time": mean_response_time(is_candidate[1:]).astype(np.float32),
+        "company_response_time": mean_response_time(~is_candidate[1:]).astype(np.float32),
+        "interactivity_metric": interactivity_metric,
+    })
     
     return chat_stats
 
 #----------------------------------------------------------------------------------------------------------------------------
 
-#function to convert date columns to binary
-def date_to_binary(date):
-    """ 
-    Convert "date" variables (liked, disliked, progressed, rejected) to binary so they are machine-readable.
-    """
-    if pd.isna(date):
-        return 0
-    else:
-        return 1
-    
-#----------------------------------------------------------------------------------------------------------------------------
-
 #function to run bio sentiemnet analysis
 
 sia = SentimentIntensityAnalyzer()
@@ -212,11 +192,42 @@ def bio_sentiment_analysis(bio):
     
     bio = str(bio)
     
+    if not bio.strip():  # empty bios have nothing to score, skip the analyzer
+        return {"neg": 0, "neu": 0, "pos": 0, "compound": 0}
     
     return sia.polarity_scores(bio)
 
 #--------------------------------------------------------------------------------------
 
+#function to run bio sentiment analysis on a whole column of bios
+
+def bio_sentiment_scores(bio_col):
+    """
+    Run sentiment analysis on every bio in a column in one pass, without building a series of dicts.
+    
+    Arguments:
+        bio_col: series of user bios
+    
+    Return:
+        DataFrame with neg, neu, pos, compound columns (float32), same index as bio_col
+    """
+    keys = ["neg", "neu", "pos", "compound"]
+    
+    # Give each unique bio a code, NaN bios get code -1
+    codes, uniques = pd.factorize(bio_col)
+    
+    # Score each unique bio once into a table, one row per unique bio,
+    # the extra last row stays 0 so NaN bios (code -1) pick it up
+    table = np.zeros((len(uniques) + 1, len(keys)), dtype=np.float32)
+    for i, bio in enumerate(uniques):
+        scores = bio_sentiment_analysis(bio)
+        table[i] = [scores[key] for key in keys]
+    
+    # Look up every bio's scores by its code, no dicts built per row
+    return pd.DataFrame(table[codes], columns=keys, index=bio_col.index)
+
+#--------------------------------------------------------------------------------------
+
 #function to remove test accounts
 
 def remove_accounts(users, tests, id_col = "user_id"):
@@ -230,6 +241,34 @@ def remove_accounts(users, tests, id_col = "user_id"):
     Returns:
         list of user ids with test accounts removed
     """
-    users = users[~users[id_col].isin(tests)].copy()
+    ids = users[id_col].to_numpy()
+    
+    # Single test account (usual case) is a plain comparison, no need to build a lookup table
+    if len(tests) == 1:
+        keep = ids != tests[0]
+    else:
+        keep = np.isin(ids, tests, invert=True)
+    
+    users = users[keep].copy()
     return users
+
+#--------------------------------------------------------------------------------------
+
+#function to clean and prepare user data
+
+def prep_users(users, tests, id_col = "user_id"):
+    """
+    Cleans and prepares user data, fixes DOBs, splits culture codes, calculates ages and removes test accounts.
+    
+    Arguments:
+        users: raw users data, must contain dob and culture_code
+        tests: list of ids of test accounts
+        
+    Returns:
+        users data with added risk, extroversion, patience, norms, age columns and test accounts removed
+    """
+    users["dob"] = clean_dobs(users["dob"])
+    users[["risk","extroversion","patience","norms"]] = split_cc(users["culture_code"])
+    users["age"] = dob_to_age(users["dob"])
+    return remove_accounts(users, tests, id_col = id_col)
     
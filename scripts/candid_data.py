@@ -1,49 +1,73 @@
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import candid_cleaning as cl
 
-# Read raw data
-users_raw = pd.read_csv("data/users_snippet.csv")
-matches_raw = pd.read_csv("data/matches_snippet.csv")
-chats_raw = pd.read_csv("data/chats_snippet.csv")
+# Read raw data, only load the columns used below and set their types while parsing
+# (bios are stored as arrow strings, one contiguous buffer instead of a python object per bio)
+score_cols = ["score_overall", "score_department", "score_culture", "score_competencies", "score_compensation",
+              "score_benefits"]
+
+users_raw = pd.read_csv("data/users_snippet.csv",
+                        usecols=["user_id", "dob", "ethnicity", "gender", "current_city", "department_name",
+                                 "culture_code", "culture_text", "expected_salary"],
+                        dtype={"user_id": "int32", "dob": "string", "ethnicity": "category", "gender": "category",
+                               "current_city": "category", "department_name": "category",
+                               "culture_text": "string[pyarrow]", "expected_salary": "float32"})
+matches_raw = pd.read_csv("data/matches_snippet.csv",
+                          usecols=["id", "job_id", "candidate_id", *score_cols,
+                                   "liked", "disliked", "progressed", "rejected"],
+                          dtype={"id": "int32", "job_id": "int32", "candidate_id": "int32",
+                                 **{col: "float32" for col in score_cols}})
+chats_raw = pd.read_csv("data/chats_snippet.csv",
+                        usecols=["match_id", "sender", "timestamp"],
+                        dtype={"match_id": "int32", "sender": "category"},
+                        parse_dates=["timestamp"])
 
 # Split off bios for sentiment analysis 
-bios_raw = users_raw[["user_id", "culture_text"]].copy()
+bios_raw = users_raw[["user_id", "culture_text"]]
 
 # List of test account id's for removal
 test_accounts = [808]
 
-# Apply formulas to clean and prepare user data
-users_raw["dob"] = users_raw["dob"].apply(cl.clean_dobs)
-users_raw[["risk","extroversion","patience","norms"]] = users_raw["culture_code"].apply(cl.split_cc)
-users_raw["age"] = cl.dob_to_age(users_raw["dob"])
-users_raw = cl.remove_accounts(users_raw, test_accounts, id_col = "user_id")
+# Clean and prepare user data, calculate chat stats and run sentiment analysis on user written bios
+# at the same time, none of them depend on each other until the merges below
+with ThreadPoolExecutor(max_workers=3) as executor:
+    users_future = executor.submit(cl.prep_users, users_raw, test_accounts, id_col = "user_id")
+    chats_future = executor.submit(cl.chat_stats, chats_raw, time_unit="m")
+    bios_future = executor.submit(cl.bio_sentiment_scores, bios_raw["culture_text"])
 
-# Apply formula to calculate chat stats
-chat_summary = cl.chat_stats(chats_raw, time_unit="m")
+users_raw = users_future.result()
+chat_summary = chats_future.result()
+bio_scores = bios_future.result()
 
-# Apply formulas to carry out sentiment analysis on user written bios
-sentiment_scores = bios_raw["culture_text"].apply(cl.bio_sentiment_analysis)
-sentiment_df = pd.json_normalize(sentiment_scores)
-bios_raw = pd.concat([bios_raw, sentiment_df], axis=1)
-
-# Apply formulas to match data 
-matches_raw["liked"] = matches_raw["liked"].apply(cl.date_to_binary)
-matches_raw["disliked"] = matches_raw["disliked"].apply(cl.date_to_binary)
-matches_raw["progressed"] = matches_raw["progressed"].apply(cl.date_to_binary)
-matches_raw["rejected"] = matches_raw["rejected"].apply(cl.date_to_binary)
+# Convert match status dates to binary (1 if date present, 0 if NaN)
+status_cols = ["liked", "disliked", "progressed", "rejected"]
+matches_raw[status_cols] = matches_raw[status_cols].notna().astype("int8")
 
 # Rename match column in matches for consistency 
-matches_raw = matches_raw.rename(columns={'id': 'match_id'})
-matches_raw = matches_raw.rename(columns={'candidate_id': 'user_id'})
+matches_raw = matches_raw.rename(columns={'id': 'match_id', 'candidate_id': 'user_id'})
 
-# Merge match and chat data
-match_chat = pd.merge(matches_raw, chat_summary, on='match_id', how='left')
+# Only keep the user and bio columns needed in candid_data, so the joins don't carry unused columns
+user_cols = ["ethnicity", "gender", "current_city", "department_name", "expected_salary",
+             "risk", "extroversion", "patience", "norms", "age"]
+bio_cols = ["neg", "pos", "compound"]
+
+# Index match, chat, user and bio data by their join keys, sorted (chat_summary is already sorted by
+# match_id). Joining two sorted indexes lets pandas merge them in one pass instead of building a hash table
+matches_raw = matches_raw.sort_values("match_id", kind="stable").set_index("match_id")
+chat_summary = chat_summary.set_index("match_id")
+users_raw = users_raw.set_index("user_id")[user_cols].sort_index(kind="stable")
+bios_raw = bio_scores[bio_cols].set_axis(pd.Index(bios_raw["user_id"])).sort_index(kind="stable")
 
-# Merge chat/match data with user data 
-user_match_chat = pd.merge(match_chat, users_raw, on='user_id', how='left')
+# Combine user data with bio sentiment data first, both are per user so this join is small
+# (outer join, bios still include removed test accounts)
+user_bios = users_raw.join(bios_raw, how="outer")
 
-# Merge chat/match/user data with bio sentiment data 
-full_data = pd.merge(user_match_chat, bios_raw, on='user_id', how='left')
+# Merge match and chat data
+match_chat = matches_raw.join(chat_summary, how="left").reset_index()
+
+# Merge chat/match data with user/bio data 
+full_data = match_chat.join(user_bios, on="user_id", how="left")
 
 # Choose columns to subset
 subset_cols = ["job_id" , "user_id" , "score_overall" , "score_department" , "score_culture" , "score_competencies" , "score_compensation",
@@ -52,10 +76,12 @@ subset_cols = ["job_id" , "user_id" , "score_overall" , "score_department" , "sc
                "risk" , "extroversion" , "patience" , "norms" , "age" , "neg" , "pos" , "compound"]
 
 # Create smaller more usable dataframe, rename columns for clarity
-candid_data = full_data[subset_cols].copy()
-candid_data = candid_data.rename(columns={ "neg":"bio_sentiment_neg" , "pos":"bio_sentiment_pos" , "compound":"bio_sentiment_compound"})
+candid_data = full_data[subset_cols].rename(columns={ "neg":"bio_sentiment_neg" , "pos":"bio_sentiment_pos" , "compound":"bio_sentiment_compound"})
 
 candid_data.to_csv("data/cleaned_candid_data.csv", index=False)
 
+# Also save as parquet, keeps column types (categories, nullable integers) and loads much faster than csv
+candid_data.to_parquet("data/cleaned_candid_data.parquet", index=False, compression="zstd")
+
 
 
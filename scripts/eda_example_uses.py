@@ -1,14 +1,17 @@
 # some example usages for the user eda functions 
 
 #import modules
+import numpy as np
 import pandas as pd
 import eda_functions as eda
 
 # load pre cleaned data
-df = pd.read_csv("data/cleaned_candid_data.csv")
+df = pd.read_parquet("data/cleaned_candid_data.parquet")
 
-# histogram of ages with boxplot
-eda.visualise_numeric(df, "age", show_boxplot=True, bins = int(df["age"].max() - df["age"].min()), color = "red")
+# histogram of ages with boxplot, one bin per year
+ages = df["age"].dropna().to_numpy()
+age_hist = np.histogram(ages, bins = np.arange(ages.min(), ages.max() + 2))
+eda.visualise_numeric(df, "age", show_boxplot=True, precomputed = age_hist, color = "red")
 
 # barchart of candidate numbers per department (top 10) 
 eda.visualise_categorical(df, "department_name", top_n = 10, horizontal = True, color = "red")
@@ -1,9 +1,11 @@
 import seaborn as sns
 import matplotlib.pyplot as plt
 import numpy as np
-from scipy import stats
 
-def visualise_numeric(df, column, show_boxplot=True, bins=30, color = "color"):
+# Largest number of points a KDE curve is drawn for, above this the KDE costs far more than the histogram
+KDE_MAX_POINTS = 5000
+
+def visualise_numeric(df, column, show_boxplot=True, bins=30, color = "color", precomputed=None):
     """
     A function for visualisation of numeric data (e.g. age, expected salary, culture code components) 
     
@@ -14,17 +16,34 @@ def visualise_numeric(df, column, show_boxplot=True, bins=30, color = "color"):
                       -if False, plot only contains histogram (choose if visualising culture code components)
         bins: of type int, number of bins for histogram (for culture code components choose bins =9)
         color: colour of the bars to be plotted
+        precomputed: optional (counts, edges) from np.histogram, histogram is drawn from these instead of
+                     binning the data again (bins is ignored and no KDE curve is drawn)
+    
+    KDE curve is only drawn if column has at most KDE_MAX_POINTS non-NaN values.
     
     Returns: 
         Either: (default) a histogram/boxplot pair (show_boxplot = True), or a histogram (show_boxplot= False)
     """
     data = df[column].dropna() # removes data that is NaN
+    kde = len(data) <= KDE_MAX_POINTS # only draw KDE curve for smaller data sets
+    
+    def histogram(ax, stat):
+        # bin the data with seaborn, unless counts have already been worked out
+        if precomputed is None:
+            sns.histplot(data, kde=kde, bins=bins, ax=ax, color=color, stat=stat)
+        else:
+            counts, edges = precomputed
+            if stat == "density":
+                counts = counts / (counts.sum() * np.diff(edges))
+            ax.stairs(counts, edges, fill=True, color=color, edgecolor="black")
+            ax.set_xlabel(column)
+            ax.set_ylabel(stat.capitalize())
     
     # if show_boxplot = True, plot the boxplot and histogram next to each other
     if show_boxplot:
         fig, axes = plt.subplots(1, 2, figsize=(12, 5))
         # histogram
-        sns.histplot(data, kde=True, bins=bins, ax=axes[0], color=color, stat="count")
+        histogram(axes[0], "count")
         axes[0].set_title(f"Distribution of {column}")
         # boxplot
         sns.boxplot(x=data, ax=axes[1], color=color)
@@ -34,7 +53,7 @@ def visualise_numeric(df, column, show_boxplot=True, bins=30, color = "color"):
     else:
         # histogram
         fig, ax = plt.subplots(figsize=(7, 5))
-        sns.histplot(data, kde=True, bins=bins, ax=ax, color=color, stat="density")
+        histogram(ax, "density")
         ax.set_title(f"Distribution of {column}")
 
     plt.tight_layout()
@@ -120,16 +139,19 @@ def grouped_avgs_plot(df, numeric_col, group_col, stat="mean", title=None, color
         Plot of "stat" of data x per group y
     """
     stat_funcs = {
-        "mean": np.mean,
-        "median": np.median,
-        "mode": lambda v: stats.mode(v, keepdims=True).mode[0]
+        "mean": "mean",
+        "median": "median",
+        "mode": lambda v: v.mode().iat[0] if v.notna().any() else np.nan  # smallest mode if tied
     }
     
     if stat not in stat_funcs:
         raise ValueError(f"Invalid stat '{stat}'. Choose from {list(stat_funcs.keys())}")
     
+    # work out stat for every group in one pass, groups kept in order of appearance
+    grouped = df.groupby(group_col, sort=False, observed=True)[numeric_col].agg(stat_funcs[stat]).reset_index()
+    
     plt.figure(figsize=(8, 6))
-    sns.barplot(x=numeric_col, y=group_col, data=df, estimator=stat_funcs[stat], ci=None, color=color, edgecolor="black")
+    sns.barplot(x=numeric_col, y=group_col, data=grouped, errorbar=None, color=color, edgecolor="black")
     
     plt.xlabel(f"{stat.capitalize()} of {numeric_col}")
     plt.ylabel(group_col)